@@ -74,14 +74,56 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Connections are persistent: opening one per request (CONN_MAX_AGE=0)
+# costs a TCP and authentication handshake that dwarfs the consumption
+# statements themselves. Health checks discard connections that died
+# while idle before they are reused.
+#
+# This applies to WSGI only, where each worker thread keeps its own
+# connection: size PostgreSQL's max_connections per thread (processes x
+# threads), not per worker process. Under ASGI, sync_to_async threads do
+# not close persistent connections reliably, so set CONN_MAX_AGE = 0 and
+# pool instead, with Django's psycopg pool (Django 5.1+,
+# 'OPTIONS': {'pool': {'min_size': 2, 'max_size': 10}}) or PgBouncer.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': None,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
 
+# When True, consumption transactions on PostgreSQL commit with
+# synchronous_commit = off: commits no longer wait for the WAL fsync, at the
+# cost of possibly losing the last acknowledged debits on a server crash.
+# Leave disabled for balances that must never be undercounted.
+# See energy.application.use_cases._relax_commit_durability.
+ENERGY_ASYNCHRONOUS_COMMIT = False
+
+
+# Caches
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+#
+# Configuring an "idempotency" alias enables the replay fast path in
+# energy/infrastructure/idempotency_cache.py: committed idempotency keys are
+# answered from the cache without opening a database transaction. The
+# database UNIQUE constraint remains the source of truth. Example (requires
+# the redis package):
+#
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+#     },
+#     'idempotency': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': 'redis://127.0.0.1:6379/1',
+#         'TIMEOUT': 86400,
+#     },
+# }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
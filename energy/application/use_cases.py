@@ -9,10 +9,19 @@ It intentionally focuses on correctness guarantees over architectural purism.
 Core guarantees provided:
 
 - Atomicity: The full operation executes inside a transaction.atomic() block.
-- Row-level locking: select_for_update() prevents concurrent reads of stale balances.
+- Conditional debit: A single guarded UPDATE ... RETURNING checks and deducts the
+  balance in one statement, so no stale balance is ever read into Python.
+  A CHECK (energy >= 0) constraint on the account table backs the guard.
 - Idempotency: Enforced via a unique constraint on idempotency_key at the database level.
-- Race-condition safety: The balance update uses a database-level F() expression.
+  A stored request hash rejects reuse of a key for a different request.
+- Cheap replay path: Known duplicates are rejected by an indexed lookup before any lock is taken,
+  returning the response stored with the original request. An optional cache in front of
+  that lookup answers retry storms without opening a database transaction.
+- Race-condition safety: The new balance is computed by the database, under the row
+  lock the UPDATE itself acquires, never from a Python-cached value.
 - Explicit domain signaling: Business rule violations raise domain-specific exceptions.
+- Optional asynchronous commit: ENERGY_ASYNCHRONOUS_COMMIT trades the durability of the
+  most recent commits for throughput on PostgreSQL; see _relax_commit_durability().
 
 Architectural note:
 
@@ -24,16 +33,298 @@ This example prioritizes transactional integrity and concurrency safety,
 as these are the critical concerns in real-world financial or quota-based systems.
 """
 
+import hashlib
+import json
 import logging
+from dataclasses import dataclass
 
-from django.db import IntegrityError, transaction
-from django.db.models import F
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
 
-from energy.domain.exceptions import IdempotencyReplay, InsufficientEnergy
-from energy.models import Account, EnergyConsumption
+from energy.domain.exceptions import IdempotencyConflict, InsufficientEnergy
+from energy.infrastructure import idempotency_cache
+from energy.models import MAX_ACCOUNT_ID, MAX_AMOUNT, Account, EnergyConsumption
 
 logger = logging.getLogger(__name__)
 
+PROCESSED = "processed"
+REPLAY = "replay"
+
+
+@dataclass(frozen=True, slots=True)
+class ConsumeResult:
+    """
+    Outcome of consume_energy.
+
+    status is PROCESSED when energy was deducted by this call and REPLAY when
+    the idempotency_key had already been processed. response is the body to
+    return in both cases; it is None only for replays of requests recorded
+    before responses were stored.
+
+    Replays are the hot path under client retries, so they are reported as a
+    return value rather than an exception.
+    """
+
+    status: str
+    response: dict | None
+
+
+def _check_column_ranges(account_id, amount):
+    """
+    Rejects values the integer columns cannot hold, before any SQL runs.
+
+    The consumption INSERT and the raw debit UPDATE pass these values
+    straight to the driver, which raises (OverflowError on SQLite, DataError
+    on PostgreSQL) instead of matching no row. An id outside the column
+    range cannot belong to any account, so it is reported as a missing one.
+    """
+    if not 1 <= account_id <= MAX_ACCOUNT_ID:
+        raise Account.DoesNotExist(f"Account {account_id} does not exist.")
+    if not 1 <= amount <= MAX_AMOUNT:
+        raise ValueError(f"amount must be between 1 and {MAX_AMOUNT}, got {amount}.")
+
+
+def _request_hash(account_id, amount):
+    """
+    Fingerprints the parameters of a consumption request.
+
+    Computed from the coerced values rather than the raw body, so formatting
+    differences ("30" vs 30, key order) do not count as a different request.
+    """
+    canonical = json.dumps({"account_id": account_id, "amount": amount}, sort_keys=True)
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+def _check_request_hash(idempotency_key, request_hash, stored_hash):
+    """
+    Raises IdempotencyConflict when a key is reused for a different request.
+
+    Rows recorded before request hashes existed have an empty hash and are
+    accepted as matching.
+    """
+    if stored_hash and stored_hash != request_hash:
+        logger.warning("Idempotency conflict: key=%s", idempotency_key)
+        raise IdempotencyConflict(idempotency_key)
+
+
+def _check_request_hashes(items, replays):
+    """Batch variant of _check_request_hash for items with a stored replay."""
+    for item in items:
+        replay = replays.get(item["idempotency_key"])
+        if replay is not None:
+            _check_request_hash(
+                item["idempotency_key"],
+                _request_hash(item["account_id"], item["amount"]),
+                replay["request_hash"],
+            )
+
+
+def _relax_commit_durability():
+    """
+    Opts the current transaction out of waiting for its WAL flush.
+
+    Enabled by settings.ENERGY_ASYNCHRONOUS_COMMIT, PostgreSQL only. With
+    SET LOCAL synchronous_commit = off, COMMIT returns before the WAL is
+    fsynced, so commit throughput is bounded by CPU rather than disk
+    latency. Consistency is unaffected: a crash can only lose the most
+    recent transactions whole, never part of one.
+
+    The tradeoff is durability. A debit acknowledged to the client can be
+    lost if the server crashes within a few WAL writer cycles. Since the
+    client already saw a success, it will not retry, and the energy stays
+    unspent. Only enable this where an occasional lost debit is acceptable,
+    such as soft quotas. It must stay off for balances that must never be
+    undercounted.
+    """
+    if not getattr(settings, "ENERGY_ASYNCHRONOUS_COMMIT", False):
+        return
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL synchronous_commit = off")
+
+
+def _record_consumptions(items):
+    """
+    Inserts consumption records, skipping idempotency keys that already exist.
+
+    Returns a dict mapping each inserted idempotency_key to its new row id;
+    duplicate keys are absent from it. ON CONFLICT DO NOTHING lets the UNIQUE
+    index reject duplicates without raising, so the replay path pays neither
+    an aborted statement nor an IntegrityError round-trip through Python.
+    """
+    table = connection.ops.quote_name(EnergyConsumption._meta.db_table)
+    created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(items))
+    params = []
+    for item in items:
+        params.extend([
+            item["account_id"],
+            item["amount"],
+            item["idempotency_key"],
+            _request_hash(item["account_id"], item["amount"]),
+            created_at,
+        ])
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} "
+            "(account_id, amount, idempotency_key, request_hash, created_at) "
+            f"VALUES {values} "
+            "ON CONFLICT (idempotency_key) DO NOTHING RETURNING idempotency_key, id",
+            params,
+        )
+        return dict(cursor.fetchall())
+
+
+def _record_consumption(account_id, amount, idempotency_key):
+    """
+    Inserts a single consumption record.
+
+    Returns the id of the inserted row, or None on a duplicate key.
+    """
+    inserted = _record_consumptions([{
+        "account_id": account_id,
+        "amount": amount,
+        "idempotency_key": idempotency_key,
+    }])
+    return inserted.get(idempotency_key)
+
+
+def _find_replay(idempotency_key):
+    """
+    Looks up a previously processed request by its idempotency_key.
+
+    Returns the stored row values, or None when the key has not been seen.
+    """
+    rows = (
+        EnergyConsumption.objects
+        .filter(idempotency_key=idempotency_key)
+        .values("request_hash", "response_json")[:1]
+    )
+    return rows[0] if rows else None
+
+
+def _find_replays(idempotency_keys):
+    """Batch variant of _find_replay, keyed by idempotency_key."""
+    return {
+        row.pop("idempotency_key"): row
+        for row in (
+            EnergyConsumption.objects
+            .filter(idempotency_key__in=idempotency_keys)
+            .values("idempotency_key", "request_hash", "response_json")
+        )
+    }
+
+
+def _debit_account(account_id, amount):
+    """
+    Deducts amount from the account only if the balance covers it.
+
+    Returns the new balance, or None when the row does not exist or holds
+    less than amount. The row lock is held only by this statement (and until
+    the surrounding transaction ends), never by a preceding SELECT.
+
+    On PostgreSQL an UPDATE that leaves key columns untouched takes a
+    FOR NO KEY UPDATE row lock. That lock does not conflict with the
+    FOR KEY SHARE lock taken by foreign-key checks, so concurrent
+    EnergyConsumption inserts referencing this account are never blocked by
+    it. A separate SELECT ... FOR NO KEY UPDATE would add a round-trip to the
+    success path to obtain the same lock.
+    """
+    table = connection.ops.quote_name(Account._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET energy = energy - %s "
+            "WHERE id = %s AND energy >= %s RETURNING energy",
+            [amount, account_id, amount],
+        )
+        row = cursor.fetchone()
+    return row[0] if row is not None else None
+
+
+def _raise_debit_failure(account_id, amount):
+    """
+    Raises the domain error for a debit that matched no row.
+
+    Rare path: a second SELECT tells a missing account apart from an
+    insufficient balance.
+    """
+    available = (
+        Account.objects
+        .filter(id=account_id)
+        .values_list("energy", flat=True)
+        .first()
+    )
+    if available is None:
+        raise Account.DoesNotExist(f"Account {account_id} does not exist.")
+
+    logger.warning(
+        "Insufficient energy: account=%s requested=%s available=%s",
+        account_id, amount, available,
+    )
+    raise InsufficientEnergy(account_id, amount, available)
+
+
+def _consume_in_database(account_id, amount, idempotency_key, request_hash):
+    """
+    Runs the consumption against the database, the source of truth.
+
+    Already-processed keys are detected by a lookup on the unique index before
+    the transaction opens, so retries never queue on the account row lock.
+    The conflict-aware INSERT remains the race-safe fallback for concurrent
+    duplicates that both pass the pre-check.
+    """
+    replay = _find_replay(idempotency_key)
+    if replay is not None:
+        _check_request_hash(idempotency_key, request_hash, replay["request_hash"])
+        logger.info(
+            "Idempotency replay: key=%s account=%s",
+            idempotency_key, account_id,
+        )
+        return ConsumeResult(REPLAY, replay["response_json"])
+
+    with transaction.atomic():
+        _relax_commit_durability()
+
+        # Record the consumption first: the UNIQUE constraint gates duplicates
+        # before the account row is touched.
+        consumption_id = _record_consumption(account_id, amount, idempotency_key)
+        if consumption_id is None:
+            # Duplicate idempotency_key: a concurrent request won the INSERT.
+            # The conflict-aware INSERT waits for it to commit, so its stored
+            # response is visible to this lookup.
+            replay = _find_replay(idempotency_key)
+            if replay is not None:
+                _check_request_hash(idempotency_key, request_hash, replay["request_hash"])
+            logger.info(
+                "Idempotency replay: key=%s account=%s",
+                idempotency_key, account_id,
+            )
+            return ConsumeResult(
+                REPLAY,
+                replay["response_json"] if replay is not None else None,
+            )
+
+        remaining_energy = _debit_account(account_id, amount)
+
+        if remaining_energy is None:
+            # Raising rolls back the consumption record inserted above.
+            _raise_debit_failure(account_id, amount)
+
+        response = {
+            "account_id": account_id,
+            "remaining_energy": remaining_energy,
+            "amount_consumed": amount,
+        }
+
+        # Stored in the same transaction so a committed key always has its response.
+        EnergyConsumption.objects.filter(id=consumption_id).update(response_json=response)
+
+    return ConsumeResult(PROCESSED, response)
+
 
 def consume_energy(account_id, amount, idempotency_key):
     """
@@ -41,46 +332,138 @@ def consume_energy(account_id, amount, idempotency_key):
 
     Guarantees:
     - Atomicity via transaction.atomic()
-    - Row-level locking via select_for_update() to prevent concurrent modification
     - Idempotency via unique constraint on idempotency_key
-    - Race-condition safety via F() expression for the balance update
+    - Overdraft safety via the energy >= amount predicate of the debit UPDATE
+    - Replays return a REPLAY result carrying the stored response of the
+      original request
+    - Reusing a key with different parameters raises IdempotencyConflict
+
+    When the idempotency cache is configured, committed keys are answered
+    from it without touching the database. The cache only ever short-circuits
+    replays; every new key is still decided by the database.
     """
-    with transaction.atomic():
-        # Lock the account row to prevent concurrent reads of stale balance
-        account = (
-            Account.objects
-            .select_for_update()
-            .get(id=account_id)
+    _check_column_ranges(account_id, amount)
+    request_hash = _request_hash(account_id, amount)
+
+    claimed, cached = idempotency_cache.claim(idempotency_key)
+    if cached is not None:
+        _check_request_hash(idempotency_key, request_hash, cached["request_hash"])
+        logger.info(
+            "Idempotency replay (cache): key=%s account=%s",
+            idempotency_key, account_id,
         )
+        return ConsumeResult(REPLAY, cached["response_json"])
 
-        if account.energy < amount:
-            logger.warning(
-                "Insufficient energy: account=%s requested=%s available=%s",
-                account_id, amount, account.energy,
-            )
-            raise InsufficientEnergy(account_id, amount, account.energy)
+    try:
+        result = _consume_in_database(account_id, amount, idempotency_key, request_hash)
+    except Exception:
+        if claimed:
+            idempotency_cache.release(idempotency_key)
+        raise
 
-        try:
-            EnergyConsumption.objects.create(
-                account_id=account_id,
-                amount=amount,
-                idempotency_key=idempotency_key,
-            )
-        except IntegrityError:
-            # Duplicate idempotency_key: this request was already processed
-            logger.info(
-                "Idempotency replay: key=%s account=%s",
-                idempotency_key, account_id,
+    if claimed:
+        if result.response is None:
+            idempotency_cache.release(idempotency_key)
+        else:
+            # Publish the response only once it is durable; runs immediately
+            # when no outer transaction is open.
+            transaction.on_commit(
+                lambda: idempotency_cache.remember(idempotency_key, request_hash, result.response)
             )
-            raise IdempotencyReplay(idempotency_key)
 
-        # F() expression ensures the UPDATE uses the database value, not the Python-cached one
-        Account.objects.filter(id=account_id).update(energy=F("energy") - amount)
+    return result
 
-        account.refresh_from_db()
 
-    return {
-        "account_id": account.id,
-        "remaining_energy": account.energy,
-        "amount_consumed": amount,
-    }
\ No newline at end of file
+async def aconsume_energy(account_id, amount, idempotency_key):
+    """
+    Async entry point for consume_energy, for callers running on an event loop.
+
+    Django's async ORM cannot open transaction.atomic() blocks, so the
+    transactional path runs through sync_to_async instead of being rewritten
+    on aupdate()/acreate(). sync_to_async is thread-sensitive by default:
+    inside an ASGI request the call runs on that request's own sync thread,
+    so the event loop stays free while it waits on the database. Outside a
+    request, every thread-sensitive call shares one thread and runs
+    serially; such callers should wrap each unit of work in asgiref's
+    ThreadSensitiveContext to give it a thread (and connection) of its own.
+    """
+    return await sync_to_async(consume_energy)(account_id, amount, idempotency_key)
+
+
+def consume_energy_bulk(items):
+    """
+    Applies a batch of consumption requests in a single transaction.
+
+    Each item is a dict with account_id, amount and idempotency_key; keys
+    must be unique within the batch. Returns one response per item, in
+    input order, identical to what consume_energy returns for that item;
+    None for replays of requests recorded before responses were stored.
+
+    Guarantees:
+    - All-or-nothing: if any account is missing or cannot cover its share
+      of the batch, or any key was used for a different request, the whole
+      batch rolls back and the error is raised.
+    - Idempotency per item: keys already processed are not applied again
+      and return their stored response.
+    - One conditional debit per distinct account, for the summed amount.
+
+    The batch shares one transaction, one multi-row INSERT and one commit,
+    so the per-request transaction and fsync overhead is paid once.
+    """
+    for item in items:
+        _check_column_ranges(item["account_id"], item["amount"])
+
+    stored = _find_replays([item["idempotency_key"] for item in items])
+    _check_request_hashes(items, stored)
+    new_items = [item for item in items if item["idempotency_key"] not in stored]
+
+    if new_items:
+        with transaction.atomic():
+            _relax_commit_durability()
+            inserted = _record_consumptions(new_items)
+
+            raced = [
+                item["idempotency_key"]
+                for item in new_items
+                if item["idempotency_key"] not in inserted
+            ]
+            if raced:
+                # Keys won by concurrent requests after the pre-check; their
+                # rows are committed and visible by now.
+                raced_replays = _find_replays(raced)
+                _check_request_hashes(items, raced_replays)
+                stored.update(raced_replays)
+
+            accepted = {}
+            for item in new_items:
+                if item["idempotency_key"] in inserted:
+                    accepted.setdefault(item["account_id"], []).append(item)
+
+            responses = []
+            # Debit accounts in id order so concurrent batches lock rows
+            # in the same order and cannot deadlock each other.
+            for account_id in sorted(accepted):
+                account_items = accepted[account_id]
+                total = sum(item["amount"] for item in account_items)
+
+                remaining_energy = _debit_account(account_id, total)
+                if remaining_energy is None:
+                    _raise_debit_failure(account_id, total)
+
+                # Report each item as if applied sequentially in input order.
+                for item in reversed(account_items):
+                    response = {
+                        "account_id": account_id,
+                        "remaining_energy": remaining_energy,
+                        "amount_consumed": item["amount"],
+                    }
+                    stored[item["idempotency_key"]] = {"response_json": response}
+                    responses.append(EnergyConsumption(
+                        id=inserted[item["idempotency_key"]],
+                        response_json=response,
+                    ))
+                    remaining_energy += item["amount"]
+
+            EnergyConsumption.objects.bulk_update(responses, ["response_json"])
+
+    return [stored[item["idempotency_key"]]["response_json"] for item in items]
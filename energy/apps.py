@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class EnergyConfig(AppConfig):
     name = 'energy'
+
+    def ready(self):
+        # Registers the app's system checks.
+        from energy import checks  # noqa: F401
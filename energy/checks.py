@@ -0,0 +1,35 @@
+"""
+System Checks — Energy App
+
+The consumption use case issues INSERT ... ON CONFLICT DO NOTHING RETURNING
+and UPDATE ... RETURNING. SQLite only supports RETURNING from 3.35, while
+Django accepts older versions, so an outdated SQLite would otherwise fail
+on every consumption request with a syntax error instead of at startup.
+"""
+
+import sqlite3
+
+from django.conf import settings
+from django.core.checks import Error, register
+
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+
+@register()
+def check_sqlite_supports_returning(app_configs, **kwargs):
+    uses_sqlite = any(
+        database["ENGINE"] == "django.db.backends.sqlite3"
+        for database in settings.DATABASES.values()
+    )
+    if not uses_sqlite or sqlite3.sqlite_version_info >= MIN_SQLITE_VERSION:
+        return []
+
+    return [
+        Error(
+            f"SQLite {sqlite3.sqlite_version} is too old for the energy app; "
+            f"{'.'.join(map(str, MIN_SQLITE_VERSION))} or later is required "
+            "for INSERT/UPDATE ... RETURNING.",
+            hint="Upgrade the SQLite library linked into Python, or use PostgreSQL.",
+            id="energy.E001",
+        )
+    ]
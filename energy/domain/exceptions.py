@@ -10,11 +10,11 @@ class InsufficientEnergy(Exception):
         )
 
 
-class IdempotencyReplay(Exception):
-    """Raised when a consumption request with a duplicate idempotency_key is detected."""
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency_key is reused with different request parameters."""
 
     def __init__(self, idempotency_key):
         self.idempotency_key = idempotency_key
         super().__init__(
-            f"Idempotency replay detected for key: {idempotency_key}"
+            f"Idempotency key {idempotency_key} was already used for a different request"
         )
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+Infrastructure Adapter — Idempotency Replay Cache
+
+This module provides an optional in-memory fast path for idempotency
+replays, backed by Django's cache framework (Redis in production).
+
+Design intent:
+
+Retry storms are the hottest path of the consumption endpoint, and every
+replay answered here never opens a database transaction. The cache is a
+shortcut, never an authority:
+
+- A key is reserved with an atomic add (Redis SET NX EX) before processing.
+- Once the transaction commits, the reservation is replaced by the response
+  and the request hash, so key reuse with other parameters is still detected.
+- On failure the reservation is released so the client can retry.
+- A reservation still in flight is not trusted: the request falls through
+  to the database, whose UNIQUE constraint decides.
+- Cache outages degrade to the database path instead of failing requests.
+
+The fast path is enabled only when an "idempotency" cache alias is
+configured in settings.CACHES. Without it, every function is a no-op.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = "idempotency"
+
+# Stored while the reserving request is still in flight.
+PENDING = "pending"
+
+
+def _cache():
+    if CACHE_ALIAS not in settings.CACHES:
+        return None
+    return caches[CACHE_ALIAS]
+
+
+def _cache_key(idempotency_key):
+    return f"idem:{idempotency_key}"
+
+
+def claim(idempotency_key):
+    """
+    Reserves idempotency_key for the current request.
+
+    Returns a (claimed, cached) tuple. cached is a dict with the request_hash
+    and response_json of an earlier committed request with the same key, or
+    None when the key is new, still in flight elsewhere, or the cache is
+    unavailable.
+    """
+    cache = _cache()
+    if cache is None:
+        return False, None
+
+    key = _cache_key(idempotency_key)
+    try:
+        if cache.add(key, PENDING):
+            return True, None
+        cached = cache.get(key)
+    except Exception:
+        logger.exception("Idempotency cache unavailable: key=%s", idempotency_key)
+        return False, None
+
+    if cached is None or cached == PENDING:
+        return False, None
+    return False, cached
+
+
+def remember(idempotency_key, request_hash, response):
+    """Replaces the reservation with the committed response."""
+    cache = _cache()
+    if cache is None:
+        return
+
+    try:
+        cache.set(
+            _cache_key(idempotency_key),
+            {"request_hash": request_hash, "response_json": response},
+        )
+    except Exception:
+        logger.exception("Idempotency cache unavailable: key=%s", idempotency_key)
+
+
+def release(idempotency_key):
+    """Drops the reservation so a failed request can be retried."""
+    cache = _cache()
+    if cache is None:
+        return
+
+    try:
+        cache.delete(_cache_key(idempotency_key))
+    except Exception:
+        logger.exception("Idempotency cache unavailable: key=%s", idempotency_key)
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-15 20:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('energy', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='energyconsumption',
+            name='response_json',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,79 @@
+"""
+Replaces the plain UNIQUE constraint on EnergyConsumption.idempotency_key
+with a covering unique index on PostgreSQL:
+
+    UNIQUE (idempotency_key) INCLUDE (account_id, response_json)
+
+Replay lookups read only columns stored in the index, so they can be
+answered by an index-only scan instead of a heap fetch per replay.
+
+The index is built CONCURRENTLY before the old constraint is dropped, so
+uniqueness is enforced throughout and writes are never blocked. Other
+backends (SQLite in development) do not support INCLUDE and keep the
+original constraint; the model state is unchanged because the column is
+unique either way.
+"""
+
+from django.db import migrations
+
+INDEX_NAME = "energy_consumption_idem_covering"
+
+
+def _unique_key_constraints(schema_editor, table):
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(cursor, table)
+    return [
+        name
+        for name, info in constraints.items()
+        if info["unique"]
+        and not info["primary_key"]
+        and not info["index"]
+        and info["columns"] == ["idempotency_key"]
+    ]
+
+
+def create_covering_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    model = apps.get_model("energy", "EnergyConsumption")
+    table = schema_editor.quote_name(model._meta.db_table)
+
+    schema_editor.execute(
+        f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME} "
+        f"ON {table} (idempotency_key) INCLUDE (account_id, response_json)"
+    )
+    for name in _unique_key_constraints(schema_editor, model._meta.db_table):
+        schema_editor.execute(
+            f"ALTER TABLE {table} DROP CONSTRAINT {schema_editor.quote_name(name)}"
+        )
+
+
+def drop_covering_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    model = apps.get_model("energy", "EnergyConsumption")
+    table = schema_editor.quote_name(model._meta.db_table)
+
+    if not _unique_key_constraints(schema_editor, model._meta.db_table):
+        schema_editor.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT "
+            f"{schema_editor.quote_name(model._meta.db_table + '_idempotency_key_key')} "
+            "UNIQUE (idempotency_key)"
+        )
+    schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('energy', '0002_energyconsumption_response_json'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_covering_index, drop_covering_index),
+    ]
@@ -0,0 +1,63 @@
+"""
+Adds EnergyConsumption.request_hash and, on PostgreSQL, rebuilds the
+covering idempotency index so replay lookups, which now also read the
+hash, remain index-only scans.
+
+The new index is built CONCURRENTLY before the previous one is dropped, so
+uniqueness is enforced throughout.
+"""
+
+from django.db import migrations, models
+
+OLD_INDEX_NAME = "energy_consumption_idem_covering"
+NEW_INDEX_NAME = "energy_consumption_idem_covering_hash"
+
+
+def _swap_index(schema_editor, model, create_name, include, drop_name):
+    table = schema_editor.quote_name(model._meta.db_table)
+    schema_editor.execute(
+        f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {create_name} "
+        f"ON {table} (idempotency_key) INCLUDE ({include})"
+    )
+    schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {drop_name}")
+
+
+def include_request_hash(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    model = apps.get_model("energy", "EnergyConsumption")
+    _swap_index(
+        schema_editor, model,
+        NEW_INDEX_NAME, "account_id, request_hash, response_json", OLD_INDEX_NAME,
+    )
+
+
+def exclude_request_hash(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    model = apps.get_model("energy", "EnergyConsumption")
+    _swap_index(
+        schema_editor, model,
+        OLD_INDEX_NAME, "account_id, response_json", NEW_INDEX_NAME,
+    )
+
+
+class Migration(migrations.Migration):
+
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('energy', '0003_energyconsumption_idem_covering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='energyconsumption',
+            name='request_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.RunPython(include_request_hash, exclude_request_hash),
+    ]
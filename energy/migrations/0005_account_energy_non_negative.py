@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-15 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('energy', '0004_energyconsumption_request_hash'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='account',
+            constraint=models.CheckConstraint(condition=models.Q(('energy__gte', 0)), name='account_energy_non_negative'),
+        ),
+    ]
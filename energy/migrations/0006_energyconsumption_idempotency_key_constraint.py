@@ -0,0 +1,135 @@
+"""
+Replaces the covering idempotency index with a plain, named unique
+constraint and records it in the model state.
+
+The covering index stored response_json in its leaf pages. Every successful
+consumption writes response_json after the INSERT, so that UPDATE touched
+an indexed column and could never be a HOT update: each success wrote new
+tuples into every index and copied the JSONB payload into the btree. The
+index-only scans it was meant to enable rarely apply to replays, which hit
+recently written rows that are not yet all-visible.
+
+The model state previously still said unique=True while PostgreSQL had no
+such constraint, so a later AlterField would try to drop a constraint that
+does not exist. The state now carries UniqueConstraint(name=CONSTRAINT_NAME)
+and the database matches it:
+
+- PostgreSQL: the unique index is built CONCURRENTLY and attached with
+  ADD CONSTRAINT ... USING INDEX, which does not rescan the table, before the
+  covering index and the leftover varchar_pattern_ops index are dropped.
+  Uniqueness is enforced throughout.
+- Other backends: the column-level UNIQUE is replaced by the named one.
+"""
+
+from django.db import migrations, models
+
+CONSTRAINT_NAME = "energy_consumption_idempotency_key_uniq"
+COVERING_INDEX_NAME = "energy_consumption_idem_covering_hash"
+
+
+def _constraint():
+    return models.UniqueConstraint(fields=["idempotency_key"], name=CONSTRAINT_NAME)
+
+
+def _plain_key_field(model):
+    field = models.CharField(max_length=100)
+    field.set_attributes_from_name("idempotency_key")
+    field.model = model
+    return field
+
+
+def _like_indexes(schema_editor, table):
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(cursor, table)
+    return [
+        name
+        for name, info in constraints.items()
+        if info["index"]
+        and not info["unique"]
+        and info["columns"] == ["idempotency_key"]
+        and name.endswith("_like")
+    ]
+
+
+def add_named_constraint(apps, schema_editor):
+    model = apps.get_model("energy", "EnergyConsumption")
+
+    if schema_editor.connection.vendor != "postgresql":
+        schema_editor.alter_field(
+            model, model._meta.get_field("idempotency_key"), _plain_key_field(model),
+        )
+        schema_editor.execute(_constraint().create_sql(model, schema_editor))
+        return
+
+    table = schema_editor.quote_name(model._meta.db_table)
+    name = schema_editor.quote_name(CONSTRAINT_NAME)
+
+    schema_editor.execute(
+        f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+        f"ON {table} (idempotency_key)"
+    )
+    schema_editor.execute(
+        f"ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}"
+    )
+    schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {COVERING_INDEX_NAME}")
+    for like_index in _like_indexes(schema_editor, model._meta.db_table):
+        schema_editor.execute(
+            f"DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(like_index)}"
+        )
+
+
+def restore_covering_index(apps, schema_editor):
+    model = apps.get_model("energy", "EnergyConsumption")
+
+    if schema_editor.connection.vendor != "postgresql":
+        schema_editor.execute(_constraint().remove_sql(model, schema_editor))
+        schema_editor.alter_field(
+            model, _plain_key_field(model), model._meta.get_field("idempotency_key"),
+        )
+        return
+
+    table = schema_editor.quote_name(model._meta.db_table)
+    like_index = schema_editor.quote_name(
+        schema_editor._create_index_name(model._meta.db_table, ["idempotency_key"], suffix="_like")
+    )
+
+    schema_editor.execute(
+        f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {COVERING_INDEX_NAME} "
+        f"ON {table} (idempotency_key) INCLUDE (account_id, request_hash, response_json)"
+    )
+    schema_editor.execute(
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {like_index} "
+        f"ON {table} (idempotency_key varchar_pattern_ops)"
+    )
+    schema_editor.execute(
+        f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {schema_editor.quote_name(CONSTRAINT_NAME)}"
+    )
+
+
+class Migration(migrations.Migration):
+
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('energy', '0005_account_energy_non_negative'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='energyconsumption',
+                    name='idempotency_key',
+                    field=models.CharField(max_length=100),
+                ),
+                migrations.AddConstraint(
+                    model_name='energyconsumption',
+                    constraint=models.UniqueConstraint(fields=('idempotency_key',), name=CONSTRAINT_NAME),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(add_named_constraint, restore_covering_index),
+            ],
+        ),
+    ]
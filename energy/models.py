@@ -12,10 +12,12 @@ rich domain modeling, but correctness under concurrent access.
 
 Key architectural decisions:
 
-- Account represents a mutable balance holder.
+- Account represents a mutable balance holder; a CHECK constraint keeps
+  its balance non-negative at the database level.
 - EnergyConsumption records individual consumption events.
 - Idempotency is enforced at the database level via a UNIQUE constraint
-  on idempotency_key.
+  on idempotency_key. The original response is stored alongside the key
+  so replays can return it unchanged.
 - Referential integrity is guaranteed through a ForeignKey relationship.
 - Traceability is supported via automatic timestamping (created_at).
 
@@ -29,6 +31,12 @@ prioritize clarity and transactional correctness over structural complexity.
 
 from django.db import models
 
+# Largest values the integer columns below can store: Account.id is a
+# BigAutoField (int8), EnergyConsumption.amount an IntegerField (int4).
+# Inputs are bounded by these before any SQL runs.
+MAX_ACCOUNT_ID = 2**63 - 1
+MAX_AMOUNT = 2**31 - 1
+
 
 class Account(models.Model):
     """
@@ -41,6 +49,16 @@ class Account(models.Model):
 
     energy = models.IntegerField()
 
+    class Meta:
+        constraints = [
+            # Last line of defense: no write path can drive a balance negative,
+            # even one that bypasses the guarded debit in the use case.
+            models.CheckConstraint(
+                condition=models.Q(energy__gte=0),
+                name="account_energy_non_negative",
+            ),
+        ]
+
     def __str__(self):
         return f"Account {self.id} - Energy: {self.energy}"
 
@@ -54,6 +72,9 @@ class EnergyConsumption(models.Model):
       duplicate processing under retries.
     - account is a foreign key to enforce referential integrity.
     - created_at provides traceability for auditing purposes.
+    - response_json stores the original response so replays return the
+      identical body without recomputation.
+    - request_hash detects reuse of a key with different parameters.
     """
 
     account = models.ForeignKey(
@@ -64,13 +85,28 @@ class EnergyConsumption(models.Model):
 
     amount = models.IntegerField()
 
-    # Unique constraint enforces idempotency at the persistence layer.
-    idempotency_key = models.CharField(
-        max_length=100,
-        unique=True
-    )
+    # Unique constraint (see Meta) enforces idempotency at the persistence layer.
+    idempotency_key = models.CharField(max_length=100)
+
+    # Fingerprint of the request parameters; a replay with a different
+    # fingerprint is a conflict, not a retry. Empty for legacy rows.
+    request_hash = models.CharField(max_length=32, blank=True, default="")
+
+    # Response body returned on success, replayed verbatim for duplicate keys.
+    response_json = models.JSONField(null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # A plain index: response_json is written after the INSERT, so
+            # keeping it out of the index lets that UPDATE stay HOT on
+            # PostgreSQL (see migration 0006).
+            models.UniqueConstraint(
+                fields=["idempotency_key"],
+                name="energy_consumption_idempotency_key_uniq",
+            ),
+        ]
+
     def __str__(self):
         return f"Consumption {self.id} - {self.amount}"
@@ -0,0 +1,46 @@
+"""
+Input Serializers — Energy Consumption Endpoints
+
+Declarative validation and coercion of request payloads, so the views stay
+thin adapters. Serializers here only check shape and types; all business
+rules (balance, idempotency) live in the application layer.
+"""
+
+from rest_framework import serializers
+
+from energy.models import MAX_ACCOUNT_ID, MAX_AMOUNT, EnergyConsumption
+
+# Upper bound on items per bulk request; keeps the multi-row INSERT well
+# under database parameter limits and the transaction short.
+MAX_BULK_ITEMS = 100
+
+
+class ConsumeEnergySerializer(serializers.Serializer):
+    """A single consumption request."""
+
+    # Bounded to the column ranges so oversized values are a 400, not a driver error.
+    account_id = serializers.IntegerField(min_value=1, max_value=MAX_ACCOUNT_ID)
+    amount = serializers.IntegerField(min_value=1, max_value=MAX_AMOUNT)
+    # Keys are opaque: whitespace is significant, length matches the column.
+    idempotency_key = serializers.CharField(
+        max_length=EnergyConsumption._meta.get_field("idempotency_key").max_length,
+        trim_whitespace=False,
+    )
+
+
+class ConsumeEnergyBulkSerializer(serializers.Serializer):
+    """A batch of consumption requests with distinct idempotency keys."""
+
+    items = ConsumeEnergySerializer(
+        many=True,
+        allow_empty=False,
+        max_length=MAX_BULK_ITEMS,
+    )
+
+    def validate_items(self, items):
+        keys = {item["idempotency_key"] for item in items}
+        if len(keys) != len(items):
+            raise serializers.ValidationError(
+                "idempotency_key values must be unique within a batch."
+            )
+        return items
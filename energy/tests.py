@@ -30,9 +30,21 @@ as transactional integrity and database-level guarantees are the
 core focus of this example.
 """
 
-from django.test import TestCase
+from unittest import mock
+
+from django.core.cache import caches
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 
+from energy.application.use_cases import (
+    PROCESSED,
+    _record_consumption,
+    aconsume_energy,
+    consume_energy,
+    consume_energy_bulk,
+)
+from energy.checks import check_sqlite_supports_returning
 from energy.models import Account, EnergyConsumption
 
 
@@ -63,8 +75,21 @@ class ConsumeEnergyEndpointTest(TestCase):
         self.assertEqual(self.account.energy, 70)
         self.assertEqual(EnergyConsumption.objects.count(), 1)
 
+    def test_success_path_does_not_reread_balance(self):
+        """The new balance comes from UPDATE ... RETURNING, not a follow-up SELECT."""
+        # Replay lookup, consumption INSERT, debit UPDATE, response UPDATE,
+        # plus the SAVEPOINT/RELEASE pair of atomic() nested in the test transaction.
+        with self.assertNumQueries(6):
+            response = self.client.post("/api/energy/consume/", {
+                "account_id": self.account.id,
+                "amount": 30,
+                "idempotency_key": "key-query-count-1",
+            })
+
+        self.assertEqual(response.data["remaining_energy"], 70)
+
     def test_idempotency_prevents_double_deduction(self):
-        """Same idempotency_key must not deduct energy twice."""
+        """Same idempotency_key must not deduct energy twice and replays the original body."""
         payload = {
             "account_id": self.account.id,
             "amount": 20,
@@ -76,12 +101,26 @@ class ConsumeEnergyEndpointTest(TestCase):
 
         second_response = self.client.post("/api/energy/consume/", payload)
         self.assertEqual(second_response.status_code, 200)
-        self.assertEqual(second_response.data["message"], "Request already processed.")
+        self.assertEqual(second_response.data, first_response.data)
 
         self.account.refresh_from_db()
         self.assertEqual(self.account.energy, 80)
         self.assertEqual(EnergyConsumption.objects.count(), 1)
 
+    def test_replay_is_answered_from_idempotency_index(self):
+        """A known key must be rejected by a single lookup, without locking the account."""
+        payload = {
+            "account_id": self.account.id,
+            "amount": 20,
+            "idempotency_key": "key-replay-precheck-1",
+        }
+        self.client.post("/api/energy/consume/", payload)
+
+        with self.assertNumQueries(1):
+            response = self.client.post("/api/energy/consume/", payload)
+
+        self.assertEqual(response.status_code, 200)
+
     def test_insufficient_energy_rolls_back(self):
         """Requesting more energy than available must fail without side effects."""
         response = self.client.post("/api/energy/consume/", {
@@ -104,6 +143,8 @@ class ConsumeEnergyEndpointTest(TestCase):
         })
 
         self.assertEqual(response.status_code, 404)
+        # The consumption row inserted before the debit must be rolled back
+        self.assertEqual(EnergyConsumption.objects.count(), 0)
 
     def test_missing_fields_returns_400(self):
         response = self.client.post("/api/energy/consume/", {
@@ -121,6 +162,78 @@ class ConsumeEnergyEndpointTest(TestCase):
 
         self.assertEqual(response.status_code, 400)
 
+    def test_out_of_range_values_return_400(self):
+        """Values the integer columns cannot hold must be rejected before any SQL runs."""
+        for field, value in [
+            ("amount", 2**64),
+            ("amount", 2**31),
+            ("account_id", 2**64),
+            ("account_id", 2**63),
+        ]:
+            payload = {
+                "account_id": self.account.id,
+                "amount": 10,
+                "idempotency_key": f"key-range-{field}-{value}",
+                field: value,
+            }
+            with self.subTest(field=field, value=value), self.assertNumQueries(0):
+                response = self.client.post("/api/energy/consume/", payload, format="json")
+
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.data["error"])
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.energy, 100)
+        self.assertEqual(EnergyConsumption.objects.count(), 0)
+
+    def test_zero_amount_is_rejected_as_non_positive(self):
+        response = self.client.post("/api/energy/consume/", {
+            "account_id": self.account.id,
+            "amount": 0,
+            "idempotency_key": "key-zero-1",
+        }, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        # 0 is a present but non-positive amount, not a missing field
+        self.assertEqual(response.data["error"]["amount"][0].code, "min_value")
+
+    def test_idempotency_key_header(self):
+        payload = {"account_id": self.account.id, "amount": 10}
+
+        first_response = self.client.post(
+            "/api/energy/consume/", payload, HTTP_IDEMPOTENCY_KEY="key-header-1",
+        )
+        second_response = self.client.post(
+            "/api/energy/consume/", payload, HTTP_IDEMPOTENCY_KEY="key-header-1",
+        )
+
+        self.assertEqual(first_response.status_code, 200)
+        self.assertEqual(second_response.data, first_response.data)
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.energy, 90)
+        self.assertEqual(EnergyConsumption.objects.get().idempotency_key, "key-header-1")
+
+    def test_key_reuse_with_different_body_returns_409(self):
+        """A replayed key must carry the same parameters as the original request."""
+        self.client.post("/api/energy/consume/", {
+            "account_id": self.account.id,
+            "amount": 10,
+            "idempotency_key": "key-conflict-1",
+        })
+
+        response = self.client.post("/api/energy/consume/", {
+            "account_id": self.account.id,
+            "amount": 50,
+            "idempotency_key": "key-conflict-1",
+        })
+
+        self.assertEqual(response.status_code, 409)
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.energy, 90)
+        self.assertEqual(EnergyConsumption.objects.count(), 1)
+
     def test_multiple_consumptions_accumulate(self):
         """Sequential valid requests with different keys must each deduct correctly."""
         self.client.post("/api/energy/consume/", {
@@ -137,3 +250,360 @@ class ConsumeEnergyEndpointTest(TestCase):
         self.account.refresh_from_db()
         self.assertEqual(self.account.energy, 45)
         self.assertEqual(EnergyConsumption.objects.count(), 2)
+
+
+class ConsumeEnergyBulkEndpointTest(TestCase):
+    """
+    Tests for POST /api/energy/consume/bulk/
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.account = Account.objects.create(energy=100)
+        self.other_account = Account.objects.create(energy=50)
+
+    def post_items(self, items):
+        return self.client.post("/api/energy/consume/bulk/", {"items": items}, format="json")
+
+    def test_batch_debits_each_account_once(self):
+        response = self.post_items([
+            {"account_id": self.account.id, "amount": 10, "idempotency_key": "key-bulk-1"},
+            {"account_id": self.other_account.id, "amount": 5, "idempotency_key": "key-bulk-2"},
+            {"account_id": self.account.id, "amount": 20, "idempotency_key": "key-bulk-3"},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        # Per-item balances read as if the items were applied in order
+        self.assertEqual(
+            [result["remaining_energy"] for result in response.data["results"]],
+            [90, 45, 70],
+        )
+
+        self.account.refresh_from_db()
+        self.other_account.refresh_from_db()
+        self.assertEqual(self.account.energy, 70)
+        self.assertEqual(self.other_account.energy, 45)
+        self.assertEqual(EnergyConsumption.objects.count(), 3)
+
+    def test_processed_keys_are_replayed_not_reapplied(self):
+        single_response = self.client.post("/api/energy/consume/", {
+            "account_id": self.account.id,
+            "amount": 30,
+            "idempotency_key": "key-bulk-replay-1",
+        })
+
+        response = self.post_items([
+            {"account_id": self.account.id, "amount": 30, "idempotency_key": "key-bulk-replay-1"},
+            {"account_id": self.account.id, "amount": 10, "idempotency_key": "key-bulk-replay-2"},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0], single_response.data)
+        self.assertEqual(response.data["results"][1]["remaining_energy"], 60)
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.energy, 60)
+        self.assertEqual(EnergyConsumption.objects.count(), 2)
+
+    def test_legacy_replay_without_stored_response(self):
+        """Rows recorded before responses were stored replay like the single endpoint."""
+        EnergyConsumption.objects.create(
+            account=self.account,
+            amount=30,
+            idempotency_key="key-bulk-legacy-1",
+        )
+
+        response = self.post_items([
+            {"account_id": self.account.id, "amount": 30, "idempotency_key": "key-bulk-legacy-1"},
+        ])
+        single_response = self.client.post("/api/energy/consume/", {
+            "account_id": self.account.id,
+            "amount": 30,
+            "idempotency_key": "key-bulk-legacy-1",
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"], [{"message": "Request already processed."}])
+        self.assertEqual(response.data["results"][0], single_response.data)
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.energy, 100)
+
+    def test_insufficient_energy_rolls_back_whole_batch(self):
+        response = self.post_items([
+            {"account_id": self.account.id, "amount": 10, "idempotency_key": "key-bulk-fail-1"},
+            {"account_id": self.other_account.id, "amount": 60, "idempotency_key": "key-bulk-fail-2"},
+        ])
+
+        self.assertEqual(response.status_code, 422)
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.energy, 100)
+        self.assertEqual(EnergyConsumption.objects.count(), 0)
+
+    def test_out_of_range_values_return_400(self):
+        for field, value in [("amount", 2**64), ("amount", 2**31), ("account_id", 2**64)]:
+            item = {
+                "account_id": self.account.id,
+                "amount": 10,
+                "idempotency_key": "key-bulk-range",
+                field: value,
+            }
+            with self.subTest(field=field, value=value), self.assertNumQueries(0):
+                response = self.post_items([item])
+
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.data["error"]["items"][0])
+
+        self.assertEqual(EnergyConsumption.objects.count(), 0)
+
+    def test_duplicate_keys_in_batch_return_400(self):
+        response = self.post_items([
+            {"account_id": self.account.id, "amount": 10, "idempotency_key": "key-bulk-dup"},
+            {"account_id": self.account.id, "amount": 10, "idempotency_key": "key-bulk-dup"},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(EnergyConsumption.objects.count(), 0)
+
+
+class AsyncConsumeEnergyTest(TestCase):
+    """
+    Tests for the async entry point of the use case and its endpoint.
+    """
+
+    def setUp(self):
+        self.account = Account.objects.create(energy=100)
+
+    async def test_aconsume_energy(self):
+        result = await aconsume_energy(self.account.id, 40, "key-async-1")
+
+        self.assertEqual(result.status, PROCESSED)
+        self.assertEqual(result.response["remaining_energy"], 60)
+        self.assertEqual(await EnergyConsumption.objects.acount(), 1)
+
+    def test_async_endpoint_consumes_and_replays(self):
+        payload = {"account_id": self.account.id, "amount": 40}
+        headers = {"Idempotency-Key": "key-async-view-1"}
+
+        first = self.client.post(
+            "/api/energy/consume/async/", payload, content_type="application/json", headers=headers,
+        )
+        second = self.client.post(
+            "/api/energy/consume/async/", payload, content_type="application/json", headers=headers,
+        )
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()["remaining_energy"], 60)
+        self.assertEqual(second.json(), first.json())
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.energy, 60)
+        self.assertEqual(EnergyConsumption.objects.count(), 1)
+
+    def test_async_endpoint_maps_errors_like_the_sync_endpoint(self):
+        response = self.client.post("/api/energy/consume/async/", {
+            "account_id": self.account.id,
+            "amount": 150,
+            "idempotency_key": "key-async-view-2",
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 422)
+
+        response = self.client.post("/api/energy/consume/async/", {
+            "account_id": self.account.id,
+            "amount": 0,
+            "idempotency_key": "key-async-view-3",
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("amount", response.json()["error"])
+
+        response = self.client.post(
+            "/api/energy/consume/async/", "not json", content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class AccountConstraintTest(TestCase):
+    """
+    Tests for the database-level guarantees on Account.
+    """
+
+    def test_negative_balance_is_rejected_by_the_database(self):
+        account = Account.objects.create(energy=10)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Account.objects.filter(id=account.id).update(energy=-1)
+
+        account.refresh_from_db()
+        self.assertEqual(account.energy, 10)
+
+
+class ColumnRangeTest(TestCase):
+    """
+    Tests for the column-range guard in the use cases, for callers that
+    bypass the serializers.
+    """
+
+    def test_out_of_range_account_id_is_reported_missing(self):
+        with self.assertNumQueries(0), self.assertRaises(Account.DoesNotExist):
+            consume_energy(2**64, 10, "key-range-1")
+
+        with self.assertNumQueries(0), self.assertRaises(Account.DoesNotExist):
+            consume_energy_bulk([
+                {"account_id": 2**64, "amount": 10, "idempotency_key": "key-range-2"},
+            ])
+
+    def test_out_of_range_amount_is_rejected(self):
+        account = Account.objects.create(energy=100)
+
+        with self.assertNumQueries(0), self.assertRaises(ValueError):
+            consume_energy(account.id, 2**31, "key-range-3")
+
+        with self.assertNumQueries(0), self.assertRaises(ValueError):
+            consume_energy_bulk([
+                {"account_id": account.id, "amount": 2**64, "idempotency_key": "key-range-4"},
+            ])
+
+
+class AsynchronousCommitTest(TestCase):
+    """
+    Tests for the ENERGY_ASYNCHRONOUS_COMMIT opt-out.
+
+    The suite runs on SQLite, where the opt-out is skipped. The PostgreSQL
+    branch is exercised by presenting the connection as PostgreSQL and
+    intercepting the SET statement before it reaches the SQLite driver.
+    """
+
+    def setUp(self):
+        self.account = Account.objects.create(energy=100)
+
+    def consume_as_postgresql(self, idempotency_key):
+        """Runs a consumption and returns every SQL statement it issued, in order."""
+        statements = []
+
+        def intercept(execute, sql, params, many, context):
+            statements.append(sql)
+            if sql.startswith("SET LOCAL"):
+                return None
+            return execute(sql, params, many, context)
+
+        with mock.patch.object(connection, "vendor", "postgresql"), \
+                connection.execute_wrapper(intercept):
+            consume_energy(self.account.id, 10, idempotency_key)
+
+        return statements
+
+    @override_settings(ENERGY_ASYNCHRONOUS_COMMIT=True)
+    def test_enabled_sets_synchronous_commit_inside_transaction(self):
+        statements = self.consume_as_postgresql("key-async-commit-1")
+
+        set_index = statements.index("SET LOCAL synchronous_commit = off")
+        # SET LOCAL only lasts until the end of the transaction, so it must be
+        # issued after atomic() opens (its SAVEPOINT inside the test
+        # transaction) and before the first write.
+        self.assertTrue(statements[set_index - 1].startswith("SAVEPOINT"))
+        self.assertTrue(statements[set_index + 1].startswith("INSERT"))
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.energy, 90)
+
+    @override_settings(ENERGY_ASYNCHRONOUS_COMMIT=False)
+    def test_disabled_keeps_synchronous_commit(self):
+        statements = self.consume_as_postgresql("key-async-commit-2")
+
+        self.assertFalse(any(sql.startswith("SET LOCAL") for sql in statements))
+
+
+class SqliteVersionCheckTest(TestCase):
+    """
+    Tests for the system check guarding the SQLite RETURNING requirement.
+    """
+
+    def test_old_sqlite_is_reported(self):
+        with mock.patch("energy.checks.sqlite3.sqlite_version_info", (3, 34, 1)):
+            errors = check_sqlite_supports_returning(None)
+
+        self.assertEqual([error.id for error in errors], ["energy.E001"])
+
+    def test_supported_sqlite_passes(self):
+        with mock.patch("energy.checks.sqlite3.sqlite_version_info", (3, 35, 0)):
+            self.assertEqual(check_sqlite_supports_returning(None), [])
+
+
+class RecordConsumptionTest(TestCase):
+    """
+    Tests for the conflict-aware INSERT that backs the race-safe replay path.
+
+    The endpoint pre-check answers most replays before this INSERT runs, so
+    the duplicate branch is exercised directly here.
+    """
+
+    def setUp(self):
+        self.account = Account.objects.create(energy=100)
+
+    def test_duplicate_key_is_skipped_without_error(self):
+        self.assertIsNotNone(_record_consumption(self.account.id, 10, "key-record-1"))
+        self.assertIsNone(_record_consumption(self.account.id, 10, "key-record-1"))
+
+        consumption = EnergyConsumption.objects.get()
+        self.assertEqual(consumption.amount, 10)
+        self.assertIsNotNone(consumption.created_at)
+
+
+IDEMPOTENCY_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "idempotency": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "idempotency-tests",
+    },
+}
+
+
+@override_settings(CACHES=IDEMPOTENCY_CACHES)
+class IdempotencyCacheTest(TestCase):
+    """
+    Tests for the optional idempotency cache in front of the database.
+
+    A local-memory cache stands in for Redis; the reservation semantics
+    (atomic add, replace on commit, delete on failure) are the same.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.account = Account.objects.create(energy=100)
+        caches["idempotency"].clear()
+
+    def test_replay_is_answered_without_database_access(self):
+        payload = {
+            "account_id": self.account.id,
+            "amount": 20,
+            "idempotency_key": "key-cache-1",
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first_response = self.client.post("/api/energy/consume/", payload)
+
+        with self.assertNumQueries(0):
+            second_response = self.client.post("/api/energy/consume/", payload)
+
+        self.assertEqual(second_response.status_code, 200)
+        self.assertEqual(second_response.data, first_response.data)
+
+    def test_failed_request_releases_reservation(self):
+        """A rejected request must not leave its key reserved in the cache."""
+        payload = {
+            "account_id": self.account.id,
+            "amount": 150,
+            "idempotency_key": "key-cache-retry-1",
+        }
+
+        response = self.client.post("/api/energy/consume/", payload)
+        self.assertEqual(response.status_code, 422)
+
+        Account.objects.filter(id=self.account.id).update(energy=200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/energy/consume/", payload)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["remaining_energy"], 50)
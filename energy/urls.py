@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import ConsumeEnergyView
+from .views import ConsumeEnergyAsyncView, ConsumeEnergyBulkView, ConsumeEnergyView
 
 urlpatterns = [
     path("consume/", ConsumeEnergyView.as_view(), name="consume-energy"),
+    path("consume/async/", ConsumeEnergyAsyncView.as_view(), name="consume-energy-async"),
+    path("consume/bulk/", ConsumeEnergyBulkView.as_view(), name="consume-energy-bulk"),
 ]
\ No newline at end of file
@@ -8,7 +8,7 @@ Design intent:
 The view acts as a thin controller following the "fat application / thin
 transport layer" principle. Its responsibilities are intentionally limited to:
 
-- Basic input validation and type coercion
+- Input validation and type coercion, declared in energy/serializers.py
 - Delegation to the application use case
 - Translation of domain exceptions into HTTP responses
 - Maintaining clear separation between transport concerns and business logic
@@ -19,7 +19,7 @@ Architectural decisions:
 - All transactional guarantees (atomicity, locking, idempotency handling)
   are delegated to the application layer.
 - Domain-specific exceptions are mapped explicitly to appropriate
-  HTTP status codes (422, 404, 200 replay, etc.).
+  HTTP status codes (422, 404, 409 key reuse, 200 replay, etc.).
 
 This structure reflects a pragmatic hexagonal approach:
 the view is an adapter translating HTTP requests into
@@ -27,13 +27,28 @@ application-level operations without leaking transport logic
 into the core use case.
 """
 
+import json
+
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from energy.application.use_cases import consume_energy
-from energy.domain.exceptions import IdempotencyReplay, InsufficientEnergy
+from energy.application.use_cases import (
+    REPLAY,
+    aconsume_energy,
+    consume_energy,
+    consume_energy_bulk,
+)
+from energy.domain.exceptions import IdempotencyConflict, InsufficientEnergy
 from energy.models import Account
+from energy.serializers import ConsumeEnergyBulkSerializer, ConsumeEnergySerializer
+
+# Body for replays of requests recorded before responses were stored.
+ALREADY_PROCESSED = {"message": "Request already processed."}
 
 
 class ConsumeEnergyView(APIView):
@@ -41,36 +56,118 @@ class ConsumeEnergyView(APIView):
     POST /api/energy/consume/
 
     Thin controller: validates input, delegates to use case, maps exceptions to HTTP responses.
+    The idempotency key is read from the Idempotency-Key header, falling back
+    to the idempotency_key body field.
     """
 
     def post(self, request):
-        account_id = request.data.get("account_id")
-        amount = request.data.get("amount")
-        idempotency_key = request.data.get("idempotency_key")
+        data = request.data
+        header_key = request.headers.get("Idempotency-Key")
+        if header_key is not None and isinstance(data, dict):
+            # The header takes precedence over the body field
+            data = data.copy()
+            data["idempotency_key"] = header_key
 
-        if not all([account_id, amount, idempotency_key]):
+        serializer = ConsumeEnergySerializer(data=data)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result = consume_energy(**serializer.validated_data)
+        except Account.DoesNotExist:
             return Response(
-                {"error": "account_id, amount, and idempotency_key are required."},
-                status=status.HTTP_400_BAD_REQUEST,
+                {"error": "Account not found."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        except InsufficientEnergy as exc:
+            return Response(
+                {"error": str(exc)},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
             )
+        except IdempotencyConflict as exc:
+            return Response(
+                {"error": str(exc)},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        # Replays return the original response body verbatim when it was stored
+        if result.status == REPLAY and result.response is None:
+            return Response(ALREADY_PROCESSED, status=status.HTTP_200_OK)
+
+        return Response(result.response, status=status.HTTP_200_OK)
+
 
+@method_decorator(csrf_exempt, name="dispatch")
+class ConsumeEnergyAsyncView(View):
+    """
+    POST /api/energy/consume/async/
+
+    Async counterpart of ConsumeEnergyView for ASGI deployments. Django REST
+    Framework views are synchronous, so this is a plain Django view: it
+    accepts a JSON body only, validates it with the same serializer and
+    returns the same status codes and bodies.
+    """
+
+    async def post(self, request):
         try:
-            account_id = int(account_id)
-            amount = int(amount)
-        except (TypeError, ValueError):
-            return Response(
-                {"error": "account_id and amount must be integers."},
+            data = json.loads(request.body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return JsonResponse(
+                {"error": "Request body must be a JSON object."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        if amount <= 0:
-            return Response(
-                {"error": "amount must be a positive integer."},
-                status=status.HTTP_400_BAD_REQUEST,
+        header_key = request.headers.get("Idempotency-Key")
+        if header_key is not None:
+            # The header takes precedence over the body field
+            data["idempotency_key"] = header_key
+
+        serializer = ConsumeEnergySerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result = await aconsume_energy(**serializer.validated_data)
+        except Account.DoesNotExist:
+            return JsonResponse(
+                {"error": "Account not found."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        except InsufficientEnergy as exc:
+            return JsonResponse(
+                {"error": str(exc)},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        except IdempotencyConflict as exc:
+            return JsonResponse(
+                {"error": str(exc)},
+                status=status.HTTP_409_CONFLICT,
             )
 
+        if result.status == REPLAY and result.response is None:
+            return JsonResponse(ALREADY_PROCESSED, status=status.HTTP_200_OK)
+
+        return JsonResponse(result.response, status=status.HTTP_200_OK)
+
+
+class ConsumeEnergyBulkView(APIView):
+    """
+    POST /api/energy/consume/bulk/
+
+    Accepts {"items": [...]} where each item has the same shape as a single
+    consumption request. The batch is applied atomically: any invalid item,
+    missing account or insufficient balance rejects the whole batch.
+    """
+
+    def post(self, request):
+        serializer = ConsumeEnergyBulkSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
-            result = consume_energy(account_id, amount, idempotency_key)
+            results = consume_energy_bulk(serializer.validated_data["items"])
         except Account.DoesNotExist:
             return Response(
                 {"error": "Account not found."},
@@ -81,10 +178,13 @@ class ConsumeEnergyView(APIView):
                 {"error": str(exc)},
                 status=status.HTTP_422_UNPROCESSABLE_ENTITY,
             )
-        except IdempotencyReplay:
+        except IdempotencyConflict as exc:
             return Response(
-                {"message": "Request already processed."},
-                status=status.HTTP_200_OK,
+                {"error": str(exc)},
+                status=status.HTTP_409_CONFLICT,
             )
 
-        return Response(result, status=status.HTTP_200_OK)
+        # Same fallback as the single endpoint for replays without a stored response
+        results = [ALREADY_PROCESSED if result is None else result for result in results]
+
+        return Response({"results": results}, status=status.HTTP_200_OK)